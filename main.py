@@ -6,16 +6,37 @@ Loads test cases, runs classification, and outputs results.
 import json
 import sys
 from pathlib import Path
+from typing import Iterator
 
 from src.taxonomy_loader import TaxonomyLoader
 from src.inference_engine import InferenceEngine
 from src.output_handler import OutputHandler
 
+try:
+    import ijson
+except ImportError:  # falls back to loading the whole file
+    ijson = None
 
-def load_test_cases(filepath: str) -> list:
-    """Load test cases from JSON file."""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return json.load(f)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def load_test_cases(filepath: str) -> Iterator[dict]:
+    """
+    Yield test cases from a JSON array file.
+
+    Streams records one at a time when ijson is installed, so processing
+    can start before the whole file is parsed.
+    """
+    with open(filepath, 'rb') as f:
+        if ijson is not None:
+            yield from ijson.items(f, 'item')
+        elif orjson is not None:
+            yield from orjson.loads(f.read())
+        else:
+            yield from json.load(f)
 
 
 def main():
@@ -23,6 +44,7 @@ def main():
     taxonomy_path = base_dir / 'data' / 'taxonomy.json'
     test_cases_path = base_dir / 'data' / 'test_cases.json'
     output_dir = base_dir / 'output'
+    cache_path = base_dir / '.cache' / 'inference.db'
 
     # Validate required files exist
     if not taxonomy_path.exists():
@@ -40,15 +62,15 @@ def main():
 
     # Initialize the LLM-based inference engine
     print('Initializing inference engine...')
-    engine = InferenceEngine(taxonomy)
+    engine = InferenceEngine(taxonomy, cache_path=str(cache_path))
 
-    # Load and process test cases
-    print('Loading test cases...')
+    # Stream test cases straight into the engine
     test_cases = load_test_cases(str(test_cases_path))
-    print(f'Loaded {len(test_cases)} test cases\n')
-
-    print('Processing...')
-    results = engine.map_batch(test_cases)
+    try:
+        results = engine.map_batch(test_cases)
+    finally:
+        engine.close()
+    print(f'Processed {len(results)} test cases')
 
     # Output results to console and JSON file
     output_handler = OutputHandler(str(output_dir))
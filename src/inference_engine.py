@@ -2,22 +2,116 @@
 Inference Engine - classifies stories using Groq LLM with prompt engineering.
 """
 
+import asyncio
+import dbm
+import hashlib
+import json
 import os
 import re
-from typing import Optional
-from dataclasses import dataclass
-
-from groq import Groq
+import shelve
+import weakref
+from pathlib import Path
+from types import MappingProxyType
+from typing import Iterable, Optional
+from dataclasses import dataclass, field, replace
+
+import httpx
+from groq import APIConnectionError, APIError, AsyncGroq, Groq, InternalServerError, RateLimitError
 from dotenv import load_dotenv
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
+from tqdm import tqdm
 
 from src.taxonomy_loader import TaxonomyLoader
 
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib json module
+    orjson = None
+
+try:
+    import ahocorasick
+except ImportError:  # falls back to the precompiled regex
+    ahocorasick = None
+
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # semantic cache is optional
+    SentenceTransformer = None
+
 load_dotenv()
 
+# Cosine similarity needed to reuse a cached answer outright, and the lower
+# bound of the "gray zone" where the cached answer is only verified by the LLM
+SEMANTIC_HIT_THRESHOLD = 0.92
+SEMANTIC_VERIFY_THRESHOLD = 0.85
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+# Snippet embeddings are stored in the response cache under this prefix + case key
+EMBEDDING_KEY_PREFIX = f'emb|{EMBEDDING_MODEL}|'
+
+# Transient API failures are retried with backoff; after this many calls in a
+# row still fail, the rest of the call to map_single/map_batch is short-circuited
+TRANSIENT_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+CIRCUIT_BREAKER_THRESHOLD = 10
+retry_transient = retry(
+    retry=retry_if_exception_type(TRANSIENT_ERRORS),
+    wait=wait_exponential_jitter(1, 30),
+    stop=stop_after_attempt(5),
+    reraise=True
+)
+
+# Completion budget per case; the expected answer is about 40 tokens
+MAX_TOKENS_PER_CASE = 80
+
+# Cases packed into one prompt by map_batch
+BATCH_SIZE = 16
+
+# MappingResult.status values
+STATUS_MAPPED = 0
+STATUS_UNMAPPED = 1
+STATUS_ERROR = 2
+
+
+def _loads(text: str):
+    """Parse JSON text; raises ValueError when it is malformed."""
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API after too many consecutive failures."""
+
+
+# TaxonomyLoader -> (categories, subcategory -> parent); weak keys so cached
+# entries go away with their loader
+_category_lists = weakref.WeakKeyDictionary()
 
-@dataclass
+
+def _build_category_list_cached(taxonomy: TaxonomyLoader) -> tuple:
+    """
+    Build the sorted 'Parent > Subcategory' list and a read-only
+    subcategory -> parent map.
+
+    Cached per taxonomy object, so re-creating an engine over the same
+    taxonomy skips the rebuild.
+    """
+    cached = _category_lists.get(taxonomy)
+    if cached is not None:
+        return cached
+
+    categories = []
+    subcat_to_parent = {}
+    for subcat in taxonomy.get_all_subcategories():
+        info = taxonomy.get_hierarchy_info(subcat)
+        if info:
+            categories.append(f"{info['parent']} > {info['subcategory']}")
+            subcat_to_parent[info['subcategory']] = info['parent']
+    cached = _category_lists[taxonomy] = (tuple(sorted(categories)), MappingProxyType(subcat_to_parent))
+    return cached
+
+
+@dataclass(slots=True, frozen=True)
 class MappingResult:
-    """Result of a taxonomy mapping operation."""
+    """Result of a taxonomy mapping operation. Frozen so status cannot drift from the flags."""
     case_id: int
     user_tags: list
     snippet: str
@@ -26,14 +120,26 @@ class MappingResult:
     reasoning: str
     is_unmapped: bool = False
     is_error: bool = False
+    status: int = field(init=False)  # STATUS_MAPPED, STATUS_UNMAPPED or STATUS_ERROR
+
+    def __post_init__(self):
+        """Fold the two flags into one status code for cheap comparisons."""
+        if self.is_error:
+            status = STATUS_ERROR
+        elif self.is_unmapped:
+            status = STATUS_UNMAPPED
+        else:
+            status = STATUS_MAPPED
+        object.__setattr__(self, 'status', status)
 
     def to_dict(self) -> dict:
         """Convert to dictionary for JSON output."""
+        category = '[UNMAPPED]' if self.is_unmapped else self.mapped_category
         return {
             'id': self.case_id,
             'user_tags': self.user_tags,
             'snippet': self.snippet,
-            'mapped_category': self.mapped_category if not self.is_unmapped else '[UNMAPPED]',
+            'mapped_category': category,
             'full_path': self.full_path,
             'reasoning': self.reasoning,
             'is_unmapped': self.is_unmapped,
@@ -50,10 +156,16 @@ class InferenceEngine:
     2. Output validated against taxonomy whitelist
     """
 
-    def __init__(self, taxonomy: TaxonomyLoader):
+    def __init__(self, taxonomy: TaxonomyLoader, cache_path: Optional[str] = '.cache/inference.db',
+                 semantic_cache: bool = False):
         self.taxonomy = taxonomy
         self.valid_categories = self._build_category_list()
+        self._build_lookups()
+        self._static_prefix = self._build_static_prefix()
+        self._static_prefix_digest = hashlib.sha256(self._static_prefix.encode('utf-8')).digest()
         self._init_client()
+        self._init_cache(cache_path)
+        self._init_semantic_cache(semantic_cache)
 
     def _init_client(self):
         """Initialize Groq API client."""
@@ -61,31 +173,204 @@ class InferenceEngine:
         if not api_key:
             raise ValueError('GROQ_API_KEY not found in environment')
 
-        self.client = Groq(api_key=api_key)
+        # Retries are handled by retry_transient, so the SDK's own are disabled
+        self.client = Groq(api_key=api_key, max_retries=0)
+        # HTTP/2 multiplexes concurrent batch requests over one TLS connection
+        self.aclient = AsyncGroq(
+            api_key=api_key,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                http2=True,
+                timeout=httpx.Timeout(30.0, connect=5.0)
+            )
+        )
+        # A dedicated loop keeps the async client's connection pool valid across map_batch calls
+        self._loop = asyncio.new_event_loop()
+        self._warmup = None
+        self._consecutive_failures = 0
         self.model = 'llama-3.3-70b-versatile'
 
-    def _build_category_list(self) -> list:
+    def _init_cache(self, cache_path: Optional[str]):
+        """Open the on-disk response cache. Pass cache_path=None to disable it."""
+        self.cache = None
+        if cache_path:
+            Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+            self.cache = shelve.open(cache_path)
+
+    def _cache_key(self, user_tags: list, snippet: str) -> str:
+        """Stable hash of model, tags and snippet. Tag order does not matter."""
+        raw = self.model + '|' + '|'.join(sorted(user_tags)) + '|' + snippet
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _get_cached(self, key: str) -> Optional[tuple]:
+        """
+        Return the cached (raw_category, reasoning) pair for key, if any.
+
+        An entry that no longer validates (e.g. the taxonomy changed since it
+        was stored) is dropped and treated as a miss.
+        """
+        if self.cache is None:
+            return None
+        entry = self.cache.get(key)
+        if entry is not None and self._validate_category(entry[0]) is None:
+            del self.cache[key]
+            return None
+        return entry
+
+    def _init_semantic_cache(self, enabled: bool):
+        """
+        Set up the semantic cache over snippet embeddings.
+
+        Disabled when sentence-transformers is not installed. The matrix is
+        seeded from the embeddings stored in the response cache, so earlier
+        runs can produce hits. The embedding model itself is loaded on first use.
+        """
+        self._semantic_enabled = enabled and SentenceTransformer is not None
+        self._embedder = None
+        self.emb_matrix = None    # (N, dim) normalized snippet embeddings
+        self.emb_entries = []     # parallel list of (raw_category, reasoning)
+        if self._semantic_enabled and self.cache is not None:
+            self._load_embeddings()
+
+    def _load_embeddings(self):
+        """Seed the semantic cache from the response cache, dropping entries that no longer validate."""
+        rows = []
+        for emb_key in [k for k in self.cache.keys() if k.startswith(EMBEDDING_KEY_PREFIX)]:
+            entry = self._get_cached(emb_key[len(EMBEDDING_KEY_PREFIX):])
+            if entry is None:
+                del self.cache[emb_key]
+                continue
+            rows.append(self.cache[emb_key])
+            self.emb_entries.append(entry)
+        if rows:
+            self.emb_matrix = np.vstack(rows)
+
+    def _embed(self, snippets):
+        """Return the normalized embedding of a snippet, or one row per snippet for a list."""
+        if self._embedder is None:
+            self._embedder = SentenceTransformer(EMBEDDING_MODEL)
+        return self._embedder.encode(snippets, normalize_embeddings=True)
+
+    def _lookup(self, key: str, snippet: str) -> tuple:
+        """
+        Look a case up in the exact cache, then the semantic cache.
+
+        Returns (answer, candidate, embedding): answer is a cached
+        (raw_category, reasoning) pair to reuse as is, candidate is a gray-zone
+        pair the LLM should verify, and embedding is kept for storing the result.
+        """
+        cached = self._get_cached(key)
+        if cached is not None or not self._semantic_enabled:
+            return cached, None, None
+
+        embedding = self._embed(snippet)
+        return (*self._semantic_match(embedding), embedding)
+
+    async def _lookup_async(self, key: str, snippet: str) -> tuple:
+        """Async counterpart of _lookup; the embedding is computed off the event loop."""
+        cached = self._get_cached(key)
+        if cached is not None or not self._semantic_enabled:
+            return cached, None, None
+
+        embedding = await asyncio.to_thread(self._embed, snippet)
+        return (*self._semantic_match(embedding), embedding)
+
+    def _semantic_match(self, embedding) -> tuple:
+        """Return (answer, candidate) for an embedding, as described in _lookup."""
+        if self.emb_matrix is None:
+            return None, None
+
+        sims = self.emb_matrix @ embedding
+        best = int(sims.argmax())
+        if sims[best] >= SEMANTIC_HIT_THRESHOLD:
+            return self.emb_entries[best], None
+        if sims[best] >= SEMANTIC_VERIFY_THRESHOLD:
+            return None, self.emb_entries[best]
+        return None, None
+
+    def _set_cached(self, key: str, embedding, result: MappingResult, raw_category: str, reasoning: str):
+        """Store a parsed LLM answer. Failed validations are not cached so they get retried."""
+        if result.status == STATUS_ERROR:
+            return
+        if self.cache is not None:
+            self.cache[key] = (raw_category, reasoning)
+        if embedding is not None:
+            row = embedding[np.newaxis, :]
+            self.emb_matrix = row if self.emb_matrix is None else np.vstack([self.emb_matrix, row])
+            self.emb_entries.append((raw_category, reasoning))
+            if self.cache is not None:
+                self.cache[EMBEDDING_KEY_PREFIX + key] = embedding
+
+    def _build_category_list(self) -> tuple:
         """Build formatted list of valid categories for the prompt."""
-        categories = []
-        for subcat in self.taxonomy.get_all_subcategories():
-            info = self.taxonomy.get_hierarchy_info(subcat)
-            if info:
-                categories.append(f"{info['parent']} > {info['subcategory']}")
-        return sorted(categories)
+        categories, self._subcat_to_parent = _build_category_list_cached(self.taxonomy)
+        return categories
+
+    def _build_lookups(self):
+        """
+        Precompute the case-insensitive category lookup, full paths and the
+        fallback matcher.
+
+        The fallback scans free text for any category name. It uses an
+        Aho-Corasick automaton when pyahocorasick is installed (one linear
+        pass) and a precompiled regex alternation otherwise.
+        """
+        self._subcats_only = tuple(c.rsplit(' > ', 1)[-1] for c in self.valid_categories)
+        self._subcat_lower_to_canonical = {s.lower(): s for s in self._subcats_only}
+        self._full_paths = {s: self.taxonomy.get_full_path(s) for s in self._subcats_only}
+        self._ac = None
+        self._fallback_re = None
+
+        if ahocorasick is not None:
+            self._ac = ahocorasick.Automaton()
+            for key, canonical in self._subcat_lower_to_canonical.items():
+                self._ac.add_word(key, (len(key), canonical))
+            self._ac.add_word('unmapped', (len('unmapped'), 'UNMAPPED'))
+            self._ac.make_automaton()
+        else:
+            self._fallback_re = re.compile(
+                r'\b(UNMAPPED|' + '|'.join(re.escape(s) for s in self._subcats_only) + r')\b',
+                re.IGNORECASE
+            )
+
+    def _find_category_name(self, text: str) -> Optional[str]:
+        """Return the first whole-word category name (or UNMAPPED) found in text."""
+        if not isinstance(text, str):
+            return None
+        if self._ac is None:
+            match = self._fallback_re.search(text)
+            return match.group(1) if match else None
+
+        lowered = text.lower()
+        for end, (length, canonical) in self._ac.iter_long(lowered):
+            start = end - length + 1
+            before = lowered[start - 1] if start > 0 else ' '
+            after = lowered[end + 1] if end + 1 < len(lowered) else ' '
+            if not (before.isalnum() or before == '_') and not (after.isalnum() or after == '_'):
+                return canonical
+        return None
 
-    def _build_prompt(self, user_tags: list, snippet: str) -> str:
+    def _build_static_prefix(self) -> str:
         """
-        Build the classification prompt.
-        
+        Build the system prompt shared by every classification request.
+
         Embeds three core rules:
         - Context Wins: story content overrides misleading tags
         - Honesty: non-fiction gets [UNMAPPED]
         - Pick From List: only valid categories allowed
+
+        Nothing per-case goes in here, so the prefix stays byte-identical
+        across calls and provider-side prefix caching can reuse it.
         """
-        categories_str = '\n'.join(f'  - {cat}' for cat in self.valid_categories)
-        tags_str = ', '.join(user_tags)
+        # One line per parent keeps the list short while still telling
+        # "Psychological" (Thriller) apart from "Psychological Horror"
+        by_parent = {}
+        for subcat in self._subcats_only:
+            by_parent.setdefault(self._subcat_to_parent[subcat], []).append(subcat)
+        categories_str = '\n'.join(f"  - {parent}: {', '.join(subcats)}" for parent, subcats in by_parent.items())
 
-        return f"""You are a story classifier for a fiction platform. Map the story to exactly one category from the list below.
+        return f"""You are a story classifier for a fiction platform. Map each story to exactly one category from the list below.
 
 RULES:
 1. CONTEXT WINS: The story snippet matters more than user tags. If tags say "Action" but the story is about a courtroom, pick "Legal Thriller".
@@ -93,37 +378,109 @@ RULES:
 3. PICK FROM LIST ONLY: Only use categories from the list below. Never invent new ones.
 
 VALID CATEGORIES:
-{categories_str}
+{categories_str}"""
+
+    def _with_prefix(self, dynamic: str) -> list:
+        """Wrap the per-case part of a prompt after the static system prefix."""
+        assert hashlib.sha256(self._static_prefix.encode('utf-8')).digest() == self._static_prefix_digest, \
+            'static prompt prefix changed between calls'
+        return [
+            {'role': 'system', 'content': self._static_prefix},
+            {'role': 'user', 'content': dynamic}
+        ]
+
+    def _build_prompt(self, user_tags: list, snippet: str) -> list:
+        """Build the classification messages for a single story."""
+        tags_str = ', '.join(user_tags)
+
+        return self._with_prefix(f"""INPUT:
+User Tags: [{tags_str}]
+Story Snippet: "{snippet}"
+
+OUTPUT FORMAT (JSON object, nothing else):
+{{"category": "<subcategory name only, like Gothic or Espionage, or UNMAPPED>", "reasoning": "<one sentence explanation>"}}""")
+
+    def _build_batch_prompt(self, cases: list) -> list:
+        """
+        Build the classification messages for several stories.
+
+        Cases are numbered by position (1..K) rather than by case id, so the
+        reply can be matched back even when ids repeat or are not integers.
+        """
+        case_blocks = []
+        for n, case in enumerate(cases, 1):
+            tags_str = ', '.join(case['user_tags'])
+            snippet = case['snippet']
+            case_blocks.append(f'CASE {n}:\nUser Tags: [{tags_str}]\nStory Snippet: "{snippet}"')
+        cases_str = '\n\n'.join(case_blocks)
+
+        return self._with_prefix(f"""Classify every case below independently.
+
+INPUT:
+{cases_str}
+
+OUTPUT FORMAT (JSON object with one entry per case, nothing else):
+{{"results": [{{"case": <number>, "category": "<subcategory name only, or UNMAPPED>", "reasoning": "<one sentence explanation>"}}]}}""")
+
+    def _parse_batch_response(self, response_text: str, count: int) -> dict:
+        """Extract {case number: (category, reasoning)} from a JSON batch reply."""
+        answers = {}
+        try:
+            obj = _loads(response_text)
+        except (ValueError, TypeError):
+            return answers
+        entries = obj.get('results') if isinstance(obj, dict) else None
+        if not isinstance(entries, list):
+            return answers
+
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                n = int(entry.get('case'))
+            except (TypeError, ValueError):
+                continue
+            category = entry.get('category')
+            if 1 <= n <= count and n not in answers and category is not None:
+                answers[n] = (str(category), str(entry.get('reasoning') or ''))
+        return answers
+
+    def _build_verify_prompt(self, user_tags: list, snippet: str, candidate: str) -> list:
+        """Build the short messages used to confirm a near-duplicate's cached category."""
+        tags_str = ', '.join(user_tags)
+
+        return [{'role': 'user', 'content': f"""You are a story classifier for a fiction platform. A very similar story was classified as "{candidate}".
 
 INPUT:
 User Tags: [{tags_str}]
 Story Snippet: "{snippet}"
 
-OUTPUT FORMAT:
-Category: [subcategory name only, like "Gothic" or "Espionage", or UNMAPPED]
-Reasoning: [one sentence explanation]"""
+If "{candidate}" also fits this story, answer with it. Otherwise answer NONE.
+
+OUTPUT FORMAT (JSON object, nothing else):
+{{"category": "<{candidate} or NONE>", "reasoning": "<one sentence explanation>"}}"""}]
+
+    def _confirm_candidate(self, candidate: tuple, answer: tuple) -> Optional[tuple]:
+        """Return the verification answer if it agrees with the candidate, else None."""
+        confirmed = self._validate_category(answer[0])
+        if confirmed is not None and confirmed == self._validate_category(candidate[0]):
+            return answer
+        return None
 
     def _parse_response(self, response_text: str) -> tuple:
-        """Extract category and reasoning from LLM response."""
-        category = None
-        reasoning = ''
-
-        for line in response_text.strip().split('\n'):
-            line = line.strip()
-            if line.lower().startswith('category:'):
-                category = line.split(':', 1)[1].strip()
-            elif line.lower().startswith('reasoning:'):
-                reasoning = line.split(':', 1)[1].strip()
-
-        # Fallback: search for category name in response if parsing failed
-        if category is None:
-            all_subcats = [c.split(' > ')[-1] for c in self.valid_categories]
-            pattern = r'\b(UNMAPPED|' + '|'.join(re.escape(s) for s in all_subcats) + r')\b'
-            match = re.search(pattern, response_text, re.IGNORECASE)
-            if match:
-                category = match.group(1)
+        """Extract category and reasoning from a JSON LLM response."""
+        if not isinstance(response_text, str):  # e.g. a reply with no content
+            return None, ''
+        try:
+            obj = _loads(response_text)
+        except ValueError:
+            obj = None
+        if isinstance(obj, dict):
+            category = obj.get('category')
+            return (None if category is None else str(category)), str(obj.get('reasoning') or '')
 
-        return category, reasoning
+        # Fallback for malformed JSON: search for a category name in the text
+        return self._find_category_name(response_text), ''
 
     def _validate_category(self, category: str) -> Optional[str]:
         """Validate category exists in taxonomy. Returns None if invalid."""
@@ -136,10 +493,9 @@ Reasoning: [one sentence explanation]"""
             return 'UNMAPPED'
 
         # Check against valid categories list
-        for valid_cat in self.valid_categories:
-            subcategory = valid_cat.split(' > ')[-1]
-            if subcategory.lower() == category_clean.lower():
-                return subcategory
+        subcategory = self._subcat_lower_to_canonical.get(category_clean.lower())
+        if subcategory is not None:
+            return subcategory
 
         # Fallback check against taxonomy directly
         if self.taxonomy.is_valid_subcategory(category_clean):
@@ -149,74 +505,335 @@ Reasoning: [one sentence explanation]"""
 
         return None
 
-    def map_single(self, case_id: int, user_tags: list, snippet: str) -> MappingResult:
-        """Classify a single story using the LLM."""
-        try:
-            prompt = self._build_prompt(user_tags, snippet)
+    def _request_kwargs(self, messages: list, max_tokens: int = MAX_TOKENS_PER_CASE) -> dict:
+        """Build the chat completion arguments shared by sync and async calls."""
+        return {
+            'model': self.model,
+            'messages': messages,
+            'temperature': 0.1,
+            'max_tokens': max_tokens,
+            'response_format': {'type': 'json_object'}
+        }
 
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{'role': 'user', 'content': prompt}],
-                temperature=0.1,
-                max_tokens=200
-            )
+    def _build_result(self, case_id: int, user_tags: list, snippet: str,
+                      raw_category: Optional[str], reasoning: str) -> MappingResult:
+        """Validate a parsed LLM answer into a MappingResult."""
+        validated = self._validate_category(raw_category)
 
-            response_text = response.choices[0].message.content
-            raw_category, reasoning = self._parse_response(response_text)
-            validated = self._validate_category(raw_category)
-
-            # Validation failed
-            if validated is None:
-                return MappingResult(
-                    case_id=case_id,
-                    user_tags=user_tags,
-                    snippet=snippet,
-                    mapped_category=None,
-                    full_path=None,
-                    reasoning=f'Could not validate LLM output: {raw_category}',
-                    is_unmapped=True,
-                    is_error=True
-                )
-
-            # Content is not fiction
-            if validated == 'UNMAPPED':
-                return MappingResult(
-                    case_id=case_id,
-                    user_tags=user_tags,
-                    snippet=snippet,
-                    mapped_category=None,
-                    full_path=None,
-                    reasoning=reasoning or 'Content does not fit fiction taxonomy.',
-                    is_unmapped=True
-                )
-
-            # Successfully classified
+        # Validation failed
+        if validated is None:
             return MappingResult(
                 case_id=case_id,
                 user_tags=user_tags,
                 snippet=snippet,
-                mapped_category=validated,
-                full_path=self.taxonomy.get_full_path(validated),
-                reasoning=reasoning or 'Classified based on story content.'
+                mapped_category=None,
+                full_path=None,
+                reasoning=f'Could not validate LLM output: {raw_category}',
+                is_unmapped=True,
+                is_error=True
             )
 
-        except Exception as e:
+        # Content is not fiction
+        if validated == 'UNMAPPED':
             return MappingResult(
                 case_id=case_id,
                 user_tags=user_tags,
                 snippet=snippet,
                 mapped_category=None,
                 full_path=None,
-                reasoning=f'Error: {str(e)}',
-                is_unmapped=True,
-                is_error=True
+                reasoning=reasoning or 'Content does not fit fiction taxonomy.',
+                is_unmapped=True
             )
 
-    def map_batch(self, cases: list) -> list:
-        """Process multiple cases sequentially."""
+        # Successfully classified
+        return MappingResult(
+            case_id=case_id,
+            user_tags=user_tags,
+            snippet=snippet,
+            mapped_category=validated,
+            full_path=self._full_paths.get(validated),
+            reasoning=reasoning or 'Classified based on story content.'
+        )
+
+    def _error_result(self, case_id: int, user_tags: list, snippet: str, error: Exception) -> MappingResult:
+        """Build the result recorded when a case could not be classified."""
+        return MappingResult(
+            case_id=case_id,
+            user_tags=user_tags,
+            snippet=snippet,
+            mapped_category=None,
+            full_path=None,
+            reasoning=f'Error: {str(error)}',
+            is_unmapped=True,
+            is_error=True
+        )
+
+    def _answer_result(self, case_id: int, user_tags: list, snippet: str,
+                       key: str, embedding, answer: tuple) -> MappingResult:
+        """
+        Build and cache the result for a parsed answer.
+
+        A failed cache write only costs a repeat request next time, so the
+        result is still returned.
+        """
+        result = self._build_result(case_id, user_tags, snippet, *answer)
+        try:
+            self._set_cached(key, embedding, result, *answer)
+        except dbm.error:
+            pass
+        return result
+
+    def _check_circuit(self):
+        """Refuse to call the API while the circuit breaker is open."""
+        if self._consecutive_failures > CIRCUIT_BREAKER_THRESHOLD:
+            raise CircuitOpenError(f'circuit open after {self._consecutive_failures} consecutive API failures')
+
+    @retry_transient
+    def _create(self, **kwargs):
+        """Call the chat completions endpoint, retrying transient failures."""
+        return self.client.chat.completions.create(**kwargs)
+
+    @retry_transient
+    async def _create_async(self, **kwargs):
+        """Async counterpart of _create."""
+        return await self.aclient.chat.completions.create(**kwargs)
+
+    def _send(self, messages: list, max_tokens: int = MAX_TOKENS_PER_CASE) -> str:
+        """Send one chat completion, retrying transient errors, and return the reply text."""
+        self._check_circuit()
+        try:
+            response = self._create(**self._request_kwargs(messages, max_tokens))
+        except TRANSIENT_ERRORS:
+            self._consecutive_failures += 1
+            raise
+        self._consecutive_failures = 0
+        return response.choices[0].message.content
+
+    async def _send_async(self, messages: list, max_tokens: int = MAX_TOKENS_PER_CASE) -> str:
+        """Async counterpart of _send."""
+        self._check_circuit()
+        try:
+            response = await self._create_async(**self._request_kwargs(messages, max_tokens))
+        except TRANSIENT_ERRORS:
+            self._consecutive_failures += 1
+            raise
+        self._consecutive_failures = 0
+        return response.choices[0].message.content
+
+    def _complete(self, messages: list) -> tuple:
+        """Send a prompt and return the parsed (raw_category, reasoning)."""
+        return self._parse_response(self._send(messages))
+
+    async def _complete_async(self, messages: list) -> tuple:
+        """Async counterpart of _complete."""
+        return self._parse_response(await self._send_async(messages))
+
+    def map_single(self, case_id: int, user_tags: list, snippet: str) -> MappingResult:
+        """Classify a single story using the LLM."""
+        self._consecutive_failures = 0
+        key = self._cache_key(user_tags, snippet)
+        cached, candidate, embedding = self._lookup(key, snippet)
+        if cached is not None:
+            return self._build_result(case_id, user_tags, snippet, *cached)
+
+        try:
+            answer = None
+            if candidate is not None:
+                verify_prompt = self._build_verify_prompt(user_tags, snippet, candidate[0])
+                answer = self._confirm_candidate(candidate, self._complete(verify_prompt))
+            if answer is None:
+                answer = self._complete(self._build_prompt(user_tags, snippet))
+        except (APIError, CircuitOpenError) as e:
+            return self._error_result(case_id, user_tags, snippet, e)
+        return self._answer_result(case_id, user_tags, snippet, key, embedding, answer)
+
+    async def _map_single_async(self, case_id: int, user_tags: list, snippet: str) -> MappingResult:
+        """Async counterpart of map_single using the AsyncGroq client."""
+        key = self._cache_key(user_tags, snippet)
+        cached, candidate, embedding = await self._lookup_async(key, snippet)
+        if cached is not None:
+            return self._build_result(case_id, user_tags, snippet, *cached)
+        return await self._classify_async(case_id, user_tags, snippet, key, candidate, embedding)
+
+    async def _classify_async(self, case_id: int, user_tags: list, snippet: str,
+                              key: str, candidate: Optional[tuple], embedding) -> MappingResult:
+        """Classify a cache miss, verifying the gray-zone candidate first if there is one."""
+        try:
+            answer = None
+            if candidate is not None:
+                verify_prompt = self._build_verify_prompt(user_tags, snippet, candidate[0])
+                answer = self._confirm_candidate(candidate, await self._complete_async(verify_prompt))
+            if answer is None:
+                answer = await self._complete_async(self._build_prompt(user_tags, snippet))
+        except (APIError, CircuitOpenError) as e:
+            return self._error_result(case_id, user_tags, snippet, e)
+        return self._answer_result(case_id, user_tags, snippet, key, embedding, answer)
+
+    async def _map_chunk_async(self, chunk: list) -> list:
+        """
+        Classify a chunk of (case, key, embedding) entries with one LLM call.
+
+        Cases the reply does not cover fall back to concurrent single-case
+        requests, as does the whole chunk when the batch request itself is
+        rejected.
+        Transient failures that outlast the retries mark the chunk as errors.
+        """
+        cases = [case for case, _, _ in chunk]
+        try:
+            messages = self._build_batch_prompt(cases)
+            response_text = await self._send_async(messages, max_tokens=MAX_TOKENS_PER_CASE * len(cases))
+            answers = self._parse_batch_response(response_text, len(cases))
+        except (*TRANSIENT_ERRORS, CircuitOpenError) as e:
+            return [self._error_result(case['id'], case['user_tags'], case['snippet'], e) for case in cases]
+        except APIError:
+            answers = {}
+
         results = []
-        for case in cases:
-            print(f"  Case {case['id']}...")
-            result = self.map_single(case['id'], case['user_tags'], case['snippet'])
-            results.append(result)
+        missing = []  # (position in chunk, case, key, embedding)
+        for n, (case, key, embedding) in enumerate(chunk, 1):
+            if n in answers:
+                results.append(self._answer_result(case['id'], case['user_tags'], case['snippet'],
+                                                   key, embedding, answers[n]))
+            else:
+                results.append(None)
+                missing.append((n - 1, case, key, embedding))
+
+        retried = await asyncio.gather(*(
+            self._classify_async(case['id'], case['user_tags'], case['snippet'], key, None, embedding)
+            for _, case, key, embedding in missing
+        ))
+        for (pos, _, _, _), result in zip(missing, retried):
+            results[pos] = result
         return results
+
+    async def _warmup_client(self):
+        """
+        Open the async connection as soon as the first batch has work to send.
+
+        It runs alongside the first requests rather than ahead of them; over
+        HTTP/2 those requests queue onto the connection being opened instead
+        of each paying for their own handshake. Failures are ignored; the real
+        requests report their own errors.
+        """
+        try:
+            await self.aclient.models.list()
+        except Exception:
+            pass
+
+    async def _map_batch_async(self, cases: Iterable[dict], concurrency: int = 16, batch_size: int = BATCH_SIZE) -> list:
+        """
+        Classify cases with batched prompts.
+
+        Cases with the same tags and snippet are classified once and the
+        result is copied to each duplicate. Exact cache hits are resolved
+        next. With the semantic cache on, the remaining snippets are embedded
+        in one call: near-duplicates of a cached case reuse its answer or, in
+        the gray zone, go through the single-case verify prompt, and
+        paraphrases within the batch are grouped like exact duplicates. The
+        rest are packed `batch_size` per prompt, with at most `concurrency`
+        requests in flight.
+        """
+        progress = tqdm(desc='Mapping', unit=' case')
+        results = []
+        misses = []      # (index, case, key)
+        pending = []     # (index, (case, key, embedding))
+        verify = []      # (index, case, key, candidate, embedding)
+        duplicates = []  # (index, index of the case it copies, case)
+        first_seen = {}  # (sorted tags, snippet) -> index
+        for i, case in enumerate(cases):
+            group = (tuple(sorted(case['user_tags'])), case['snippet'])
+            if group in first_seen:
+                results.append(None)
+                duplicates.append((i, first_seen[group], case))
+                continue
+            first_seen[group] = i
+
+            key = self._cache_key(case['user_tags'], case['snippet'])
+            cached = self._get_cached(key)
+            if cached is not None:
+                results.append(self._build_result(case['id'], case['user_tags'], case['snippet'], *cached))
+                progress.update()
+            else:
+                results.append(None)
+                misses.append((i, case, key))
+
+        if self._semantic_enabled and misses:
+            embeddings = await asyncio.to_thread(self._embed, [case['snippet'] for _, case, _ in misses])
+            pending_embs = np.empty_like(embeddings)  # rows for the cases in pending_ids
+        else:
+            embeddings = [None] * len(misses)
+        pending_ids = []
+        for (i, case, key), embedding in zip(misses, embeddings):
+            if embedding is None:
+                pending.append((i, (case, key, None)))
+                continue
+            cached, candidate = self._semantic_match(embedding)
+            if cached is not None:
+                results[i] = self._build_result(case['id'], case['user_tags'], case['snippet'], *cached)
+                progress.update()
+                continue
+            if candidate is not None:
+                verify.append((i, case, key, candidate, embedding))
+                continue
+            if pending_ids:
+                sims = pending_embs[:len(pending_ids)] @ embedding
+                best = int(sims.argmax())
+                if sims[best] >= SEMANTIC_HIT_THRESHOLD:
+                    duplicates.append((i, pending_ids[best], case))
+                    continue
+            pending_embs[len(pending_ids)] = embedding
+            pending_ids.append(i)
+            pending.append((i, (case, key, embedding)))
+
+        sem = asyncio.Semaphore(concurrency)
+        self._consecutive_failures = 0
+        if self._warmup is None and (pending or verify):
+            self._warmup = asyncio.ensure_future(self._warmup_client())
+
+        async def run(chunk: list) -> list:
+            async with sem:
+                chunk_result = await self._map_chunk_async(chunk)
+            progress.update(len(chunk))
+            return chunk_result
+
+        async def run_verify(i: int, case: dict, key: str, candidate: tuple, embedding):
+            async with sem:
+                results[i] = await self._classify_async(
+                    case['id'], case['user_tags'], case['snippet'], key, candidate, embedding)
+            progress.update()
+
+        chunks = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+        chunk_results = await asyncio.gather(
+            *(run([entry for _, entry in chunk]) for chunk in chunks),
+            *(run_verify(*entry) for entry in verify)
+        )
+
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            for (i, _), result in zip(chunk, chunk_result):
+                results[i] = result
+
+        # In index order, so a copy of a copy reads a result that is already filled in
+        for i, first, case in sorted(duplicates, key=lambda d: d[0]):
+            results[i] = replace(results[first], case_id=case['id'], user_tags=case['user_tags'],
+                                 snippet=case['snippet'])
+        progress.update(len(duplicates))
+        progress.close()
+        return results
+
+    def map_batch(self, cases: Iterable[dict], concurrency: int = 16, batch_size: int = BATCH_SIZE) -> list:
+        """
+        Process multiple cases in batched, concurrent LLM calls.
+
+        cases may be any iterable, including a generator; it is consumed once.
+        Results keep the input order.
+        """
+        return self._loop.run_until_complete(self._map_batch_async(cases, concurrency, batch_size))
+
+    def close(self):
+        """Release the async client, its event loop and the response cache."""
+        if self._warmup is not None:
+            self._warmup.cancel()
+        self._loop.run_until_complete(self.aclient.close())
+        self._loop.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -6,7 +6,19 @@ import json
 from pathlib import Path
 from typing import List
 
-from src.inference_engine import MappingResult
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib json module
+    orjson = None
+
+from src.inference_engine import STATUS_ERROR, STATUS_UNMAPPED, MappingResult
+
+
+def _dumps(obj) -> bytes:
+    """Serialize obj as 2-space indented JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
 
 
 class OutputHandler:
@@ -29,9 +41,9 @@ class OutputHandler:
             snippet_display = r.snippet[:70] + '...' if len(r.snippet) > 70 else r.snippet
             print(f'Snippet: {snippet_display}')
 
-            if r.is_error:
+            if r.status == STATUS_ERROR:
                 print('Mapping: [ERROR]')
-            elif r.is_unmapped:
+            elif r.status == STATUS_UNMAPPED:
                 print('Mapping: [UNMAPPED]')
             else:
                 print(f'Mapping: {r.full_path}')
@@ -40,41 +52,54 @@ class OutputHandler:
 
         self._print_summary(results)
 
+    def _build_summary(self, results: List[MappingResult]) -> dict:
+        """Count outcomes and the category distribution in a single pass."""
+        mapped = unmapped = errors = 0
+        category_counts = {}
+        for r in results:
+            status = r.status
+            if status == STATUS_ERROR:
+                errors += 1
+            elif status == STATUS_UNMAPPED:
+                unmapped += 1
+            else:
+                mapped += 1
+                if r.mapped_category:
+                    category_counts[r.mapped_category] = category_counts.get(r.mapped_category, 0) + 1
+
+        return {
+            'total': len(results),
+            'mapped': mapped,
+            'unmapped': unmapped,
+            'errors': errors,
+            'categories': category_counts
+        }
+
     def _print_summary(self, results: List[MappingResult]):
         """Print summary statistics."""
-        total = len(results)
-        mapped = sum(1 for r in results if not r.is_unmapped and not r.is_error)
-        unmapped = sum(1 for r in results if r.is_unmapped and not r.is_error)
-        errors = sum(1 for r in results if r.is_error)
+        summary = self._build_summary(results)
 
         print('=' * 60)
         print('SUMMARY')
         print('=' * 60)
-        print(f'Total: {total} | Mapped: {mapped} | Unmapped: {unmapped} | Errors: {errors}')
+        print(f"Total: {summary['total']} | Mapped: {summary['mapped']} | "
+              f"Unmapped: {summary['unmapped']} | Errors: {summary['errors']}")
         print('=' * 60)
 
     def write_json(self, results: List[MappingResult], filename: str = 'results.json') -> str:
         """Write results to JSON file."""
         output_path = self.output_dir / filename
 
-        # Build category distribution
-        category_counts = {}
-        for r in results:
-            if r.mapped_category and not r.is_unmapped:
-                category_counts[r.mapped_category] = category_counts.get(r.mapped_category, 0) + 1
-
-        output_data = {
-            'results': [r.to_dict() for r in results],
-            'summary': {
-                'total': len(results),
-                'mapped': sum(1 for r in results if not r.is_unmapped and not r.is_error),
-                'unmapped': sum(1 for r in results if r.is_unmapped and not r.is_error),
-                'errors': sum(1 for r in results if r.is_error),
-                'categories': category_counts
-            }
-        }
-
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, indent=2)
+        # Stream one record at a time instead of materializing the whole
+        # document; each piece is re-indented to its nesting depth so the
+        # file matches a single indented dump
+        with open(output_path, 'wb', buffering=1 << 20) as f:
+            f.write(b'{\n  "results": [')
+            for i, r in enumerate(results):
+                f.write(b',\n    ' if i else b'\n    ')
+                f.write(_dumps(r.to_dict()).replace(b'\n', b'\n    '))
+            f.write(b'\n  ],\n  "summary": ' if results else b'],\n  "summary": ')
+            f.write(_dumps(self._build_summary(results)).replace(b'\n', b'\n  '))
+            f.write(b'\n}')
 
         return str(output_path)
@@ -3,9 +3,15 @@ Taxonomy Loader - handles loading and querying the category hierarchy.
 """
 
 import json
+import sys
 from pathlib import Path
 from typing import Optional
 
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib json module
+    orjson = None
+
 
 class TaxonomyLoader:
     """Loads taxonomy JSON and provides lookup methods for categories."""
@@ -13,44 +19,44 @@ class TaxonomyLoader:
     def __init__(self, taxonomy_path: str):
         self.taxonomy_path = Path(taxonomy_path)
         self.raw_taxonomy = {}
-        self.subcategory_map = {}  # subcategory -> {root, parent, subcategory}
-        self.parent_map = {}       # parent -> [subcategories]
+        self.subcategory_map = {}   # subcategory -> (root, parent, subcategory)
+        self._full_path_cache = {}  # subcategory -> 'Root > Parent > Subcategory'
+        self.parent_map = {}        # parent -> [subcategories]
         self.all_subcategories = set()
         self._load()
 
     def _load(self):
         """Load taxonomy from file and build lookup structures."""
-        with open(self.taxonomy_path, 'r', encoding='utf-8') as f:
-            self.raw_taxonomy = json.load(f)
+        # Both parsers decode UTF-8 bytes directly, skipping the text layer
+        with open(self.taxonomy_path, 'rb') as f:
+            data = f.read()
+        self.raw_taxonomy = orjson.loads(data) if orjson is not None else json.loads(data)
         self._build_maps()
 
     def _build_maps(self):
         """Build flattened lookup maps from nested taxonomy structure."""
         for root, genres in self.raw_taxonomy.items():
+            root = sys.intern(root)
             for parent, subcategories in genres.items():
+                parent = sys.intern(parent)
                 self.parent_map[parent.lower()] = [s.lower() for s in subcategories]
 
                 for subcategory in subcategories:
                     key = subcategory.lower()
-                    self.subcategory_map[key] = {
-                        'root': root,
-                        'parent': parent,
-                        'subcategory': subcategory
-                    }
+                    self.subcategory_map[key] = (root, parent, subcategory)
+                    self._full_path_cache[key] = f'{root} > {parent} > {subcategory}'
                     self.all_subcategories.add(key)
 
     def get_full_path(self, subcategory: str) -> Optional[str]:
         """Get full path like 'Fiction > Horror > Gothic' for a subcategory."""
-        key = subcategory.lower()
-        if key not in self.subcategory_map:
-            return None
-
-        info = self.subcategory_map[key]
-        return f"{info['root']} > {info['parent']} > {info['subcategory']}"
+        return self._full_path_cache.get(subcategory.lower())
 
     def get_hierarchy_info(self, subcategory: str) -> Optional[dict]:
         """Get dict with root, parent, subcategory for a given subcategory."""
-        return self.subcategory_map.get(subcategory.lower())
+        info = self.subcategory_map.get(subcategory.lower())
+        if info is None:
+            return None
+        return dict(zip(('root', 'parent', 'subcategory'), info))
 
     def is_valid_subcategory(self, name: str) -> bool:
         """Check if name is a valid subcategory."""